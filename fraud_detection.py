@@ -1,5 +1,11 @@
+import io
+import numpy as np
+from numba import njit, prange, types
 import pandas as pd
+import pyarrow.csv as pa_csv
+from pandas.api.types import union_categoricals
 from pathlib import Path
+import re
 import sys
 
 # ---------------------------
@@ -10,17 +16,33 @@ def list_columns_notice(df, label):
     for c in df.columns:
         print(" -", c)
 
+class ColumnIndex:
+    """
+    Column names of one CSV plus their lowercase forms, computed once and
+    shared by auto_find_column / ask_column.
+    """
+    def __init__(self, cols):
+        self.cols = list(cols)
+        self.low = [c.lower() for c in self.cols]
+        self.names = set(self.cols)
+        self.low_set = {low: c for c, low in zip(self.cols, self.low)}
+
 def ask_column(name, df_columns, default_candidates=None):
     """
     Ask the user which column to use for `name`.
-    - df_columns: list-like of available columns (strings)
+    - df_columns: ColumnIndex or list-like of available columns (strings)
     - default_candidates: ordered list of possible defaults (strings)
     Returns selected column name (must be one of df_columns).
+    A name differing only in case from a column is accepted as that column.
     """
+    if not isinstance(df_columns, ColumnIndex):
+        df_columns = ColumnIndex(df_columns)
+    cols_set = df_columns.names
+    cols_low = df_columns.low_set
     default = None
     if default_candidates:
         for cand in default_candidates:
-            if cand in df_columns:
+            if cand in cols_set:
                 default = cand
                 break
 
@@ -38,31 +60,88 @@ def ask_column(name, df_columns, default_candidates=None):
     sel = input("> ").strip()
     if sel == "" and default:
         sel = default
+    sel = cols_low.get(sel.lower(), sel) if sel not in cols_set else sel
 
     # validate
-    if sel not in df_columns:
+    if sel not in cols_set:
         print(f" -> ERROR: '{sel}' is not a valid column name. Please choose from the list above.")
         # show columns again and re-ask once
-        list_columns_notice(pd.DataFrame(columns=df_columns), "available columns")
+        list_columns_notice(pd.DataFrame(columns=df_columns.cols), "available columns")
         sel = input("Try again (enter column name exactly): ").strip()
         if sel == "" and default:
             sel = default
-    if sel not in df_columns:
+        sel = cols_low.get(sel.lower(), sel) if sel not in cols_set else sel
+    if sel not in cols_set:
         raise KeyError(f"Invalid column selected for '{name}': '{sel}'")
     return sel
 
 def auto_find_column(columns, keywords):
     """
     Return first column that contains any keyword in its name (case-insensitive).
+    columns: ColumnIndex or list-like of column names.
     keywords: list of substrings to look for, ordered by priority.
     """
-    cols_low = [c.lower() for c in columns]
-    for kw in keywords:
-        for c, low in zip(columns, cols_low):
-            if kw.lower() in low:
+    if not isinstance(columns, ColumnIndex):
+        columns = ColumnIndex(columns)
+    kws_low = [kw.lower() for kw in keywords]
+    # one compiled scan over the precomputed lowercase names finds every candidate ...
+    pat = re.compile("|".join(re.escape(kw) for kw in kws_low))
+    cols_low = [(c, low) for c, low in zip(columns.cols, columns.low) if pat.search(low)]
+    # ... then keyword priority is resolved among those candidates only
+    for kw in kws_low:
+        for c, low in cols_low:
+            if kw in low:
                 return c
     return None
 
+def align_id_categories(left, right):
+    """
+    Return `left` and `right` as categoricals sharing one category set, so IDs
+    from two files can be matched on integer codes.
+    Categories are int64 when every ID on both sides is an integer written
+    plainly (e.g. 17 and "17"), otherwise str. Only the distinct values are
+    converted, not every row.
+    """
+    def as_category(series):
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype("category")
+        return series
+
+    def int_categories(cats):
+        try:
+            ints = cats.astype("int64")
+        except (ValueError, TypeError, OverflowError):
+            return None
+        # reject lossy casts (1.5 -> 1, "01" -> 1) so matching stays the same as on str
+        return ints if (ints.astype(str) == cats.astype(str)).all() else None
+
+    left, right = as_category(left), as_category(right)
+    left_ints = int_categories(left.cat.categories)
+    right_ints = int_categories(right.cat.categories)
+    if left_ints is not None and right_ints is not None:
+        left = left.cat.rename_categories(left_ints)
+        right = right.cat.rename_categories(right_ints)
+    else:
+        left = left.cat.rename_categories(left.cat.categories.astype(str))
+        right = right.cat.rename_categories(right.cat.categories.astype(str))
+
+    cats = union_categoricals([left.array, right.array]).categories
+    return left.cat.set_categories(cats), right.cat.set_categories(cats)
+
+def select_quantile(values, q):
+    """
+    Linear-interpolated quantile (same result as Series.quantile) using
+    np.partition quickselect, O(n) instead of a full sort.
+    Returns 0.0 for an empty array.
+    """
+    if values.size == 0:
+        return 0.0
+    pos = q * (values.size - 1)
+    lo = int(np.floor(pos))
+    hi = int(np.ceil(pos))
+    part = np.partition(values, [lo, hi])
+    return float(part[lo] + (part[hi] - part[lo]) * (pos - lo))
+
 # ---------------------------
 # Dealer detection: flag by average kg per transaction
 # ---------------------------
@@ -71,50 +150,82 @@ def detect_dealer_by_avg_tx(df_trans, mapping, avg_tx_percentile=0.95, min_avg_k
     Flag dealers based on average kg per transaction (Avg_KG_per_Tx).
     - avg_tx_percentile: percentile threshold to use (e.g., 0.95 flags top 5% by avg).
     - min_avg_kg: optional absolute minimum average kg to flag (used in addition to percentile).
+    Expects the quantity column already coerced to float64 (done once in main).
     Returns (flagged_df, summary_df).
     """
-    trans = df_trans.copy()
-    # rename using mapping
+    # project the two needed columns and rename using mapping (no full-frame copy)
     dealer_col = mapping["transactions"]["dealer_id"]
     qty_col = mapping["transactions"]["quantity"]
-    trans = trans.rename(columns={dealer_col: "DealerID", qty_col: "Quantity_KG"})
-
-    # coerce numeric
-    trans["Quantity_KG"] = pd.to_numeric(trans["Quantity_KG"], errors="coerce").fillna(0.0)
+    trans = df_trans[[dealer_col, qty_col]].rename(columns={dealer_col: "DealerID", qty_col: "Quantity_KG"})
 
     # compute per-dealer metrics
-    dealer_counts = trans["DealerID"].value_counts().rename("Transaction_Count")
-    dealer_sums = trans.groupby("DealerID")["Quantity_KG"].sum().rename("Total_KG")
-    summary = pd.concat([dealer_counts, dealer_sums], axis=1).fillna(0)
-    summary = summary.reset_index().rename(columns={"index": "DealerID"})
-    # avoid division by zero
+    # single pass: one hash of DealerID yields both count and total
+    summary = (
+        trans.groupby("DealerID", sort=False, observed=True)["Quantity_KG"]
+        .agg(Transaction_Count="size", Total_KG="sum")
+        .reset_index()
+    )
+    # every grouped dealer has Transaction_Count >= 1 and a NaN-skipping sum, so no fill needed
     summary["Avg_KG_per_Tx"] = summary["Total_KG"] / summary["Transaction_Count"]
-    summary["Avg_KG_per_Tx"] = summary["Avg_KG_per_Tx"].fillna(0.0)
-
-    # diagnostics
-    print("\n[Dealer diagnostics] Top 20 by average kg per transaction:")
-    print(summary.sort_values("Avg_KG_per_Tx", ascending=False).head(20).to_string(index=False))
-    print("\n[Dealer diagnostics] Top 20 by total kg sold:")
-    print(summary.sort_values("Total_KG", ascending=False).head(20).to_string(index=False))
-    print("\n[Dealer diagnostics] Top 20 by transaction count:")
-    print(summary.sort_values("Transaction_Count", ascending=False).head(20).to_string(index=False))
+    if summary.empty:
+        return summary, summary
+
+    # diagnostics (collected and written to stdout in one go)
+    buf = io.StringIO()
+    print("\n[Dealer diagnostics] Top 20 by average kg per transaction:", file=buf)
+    print(summary.nlargest(20, "Avg_KG_per_Tx").to_string(index=False), file=buf)
+    print("\n[Dealer diagnostics] Top 20 by total kg sold:", file=buf)
+    print(summary.nlargest(20, "Total_KG").to_string(index=False), file=buf)
+    print("\n[Dealer diagnostics] Top 20 by transaction count:", file=buf)
+    print(summary.nlargest(20, "Transaction_Count").to_string(index=False), file=buf)
 
     # percentile threshold and optional absolute floor
-    avg_threshold = summary["Avg_KG_per_Tx"].quantile(avg_tx_percentile) if not summary.empty else 0.0
+    avg_threshold = select_quantile(summary["Avg_KG_per_Tx"].to_numpy(dtype="float64"), avg_tx_percentile)
     if min_avg_kg is not None:
         avg_threshold = max(avg_threshold, float(min_avg_kg))
 
-    print(f"\nUsing threshold -> Avg_KG_per_Tx >= {avg_threshold:.2f} (percentile={avg_tx_percentile}, min_avg_kg={min_avg_kg})")
+    print(f"\nUsing threshold -> Avg_KG_per_Tx >= {avg_threshold:.2f} (percentile={avg_tx_percentile}, min_avg_kg={min_avg_kg})", file=buf)
 
     # flag only on average per tx
-    summary["Flag_AvgTx"] = summary["Avg_KG_per_Tx"] >= avg_threshold
-    flagged = summary[summary["Flag_AvgTx"]].sort_values(by="Avg_KG_per_Tx", ascending=False).reset_index(drop=True)
+    mask = summary["Avg_KG_per_Tx"].to_numpy() >= avg_threshold
+    flagged = summary.iloc[mask.nonzero()[0]].sort_values(by="Avg_KG_per_Tx", ascending=False).reset_index(drop=True)
 
+    sys.stdout.write(buf.getvalue())
     return flagged, summary
 
 # ---------------------------
 # Load CSVs (with interactive path or default)
 # ---------------------------
+def read_csv_header(path):
+    """
+    Column names of a CSV as the pyarrow parser names them, so they can be
+    passed back as `usecols` to read_csv_cached. (The C engine renames blank
+    and duplicate headers to 'Unnamed: N' / 'X.1', which pyarrow does not.)
+    """
+    return pa_csv.open_csv(path).schema.names
+
+def read_csv_cached(path, usecols=None):
+    """
+    Read a CSV (optionally only `usecols`), reusing a sibling .feather cache
+    when it is at least as new as the CSV and holds the requested columns.
+    On a cache miss the CSV is parsed and the cache (re)written.
+    """
+    cache = path.with_suffix(".feather")
+    if cache.exists() and cache.stat().st_mtime >= path.stat().st_mtime:
+        wanted = usecols if usecols is not None else read_csv_header(path)
+        try:
+            return pd.read_feather(cache, columns=wanted, dtype_backend="pyarrow")
+        except ValueError:
+            pass  # cache was written for a different column selection
+
+    # pyarrow engine parses multithreaded and keeps strings Arrow-backed (no Python str objects)
+    df = pd.read_csv(path, usecols=usecols, engine="pyarrow", dtype_backend="pyarrow")
+    try:
+        df.to_feather(cache)
+    except (OSError, ValueError) as e:  # ValueError: feather rejects duplicate column names
+        print(f"Note: could not write cache '{cache}': {e}")
+    return df
+
 def load_csv_interactive():
     print("Enter the path to the farmers CSV (press Enter to use default './farmers_200_with_villageid.csv'):")
     farmers_path = input("> ").strip() or "./farmers_200_with_villageid.csv"
@@ -128,9 +239,17 @@ def load_csv_interactive():
     if not pt.exists():
         raise FileNotFoundError(f"Transactions file not found: {pt.resolve()}")
 
-    df_farmers = pd.read_csv(pf)
-    df_trans = pd.read_csv(pt)
-    return df_farmers, df_trans
+    # headers only: columns are mapped first, then only those are loaded
+    df_farmers = pd.DataFrame(columns=read_csv_header(pf))
+    df_trans = pd.DataFrame(columns=read_csv_header(pt))
+    return pf, pt, df_farmers, df_trans
+
+def mapped_columns(section):
+    """
+    Source columns selected in one side of the mapping (e.g. mapping["farmers"]),
+    skipping optional ones left unset.
+    """
+    return list(dict.fromkeys(c for c in section.values() if c is not None))
 
 # ---------------------------
 # Interactive mapping + robust detections
@@ -140,8 +259,9 @@ def get_column_mapping(df_farmers, df_trans):
     list_columns_notice(df_farmers, "FARMERS CSV")
     list_columns_notice(df_trans, "TRANSACTIONS CSV")
 
-    fam_cols = list(df_farmers.columns)
-    trans_cols = list(df_trans.columns)
+    # lowercase forms computed once per file, reused by every lookup below
+    fam_cols = ColumnIndex(df_farmers.columns)
+    trans_cols = ColumnIndex(df_trans.columns)
 
     # Ask for FarmerID mapping (must be present in both)
     fam_id_default = auto_find_column(fam_cols, ["farmerid", "farmer_id", "id", "farmer"])
@@ -203,61 +323,80 @@ def get_column_mapping(df_farmers, df_trans):
 # ---------------------------
 # Fraud detection functions (use mapping)
 # ---------------------------
+# Numba kernels live at module scope with cache=True so the compiled code is
+# reused across runs. An explicit signature compiles (or loads from cache) at
+# import; inputs are typed readonly because pandas' to_numpy() may return
+# read-only views, and writable arrays still match.
+_RO_F8 = types.Array(types.float64, 1, "A", readonly=True)
+
+@njit(types.Tuple((types.boolean[:], types.float64[:]))(_RO_F8, _RO_F8, types.float64),
+      cache=True, parallel=True)
+def _flag(qty, land, limit):
+    """
+    Fused pass over transactions: Max_Allowed_KG = land * limit and the
+    over-buying mask (qty > max allowed). NaN land/qty never flags.
+    """
+    mask = np.empty(qty.size, np.bool_)
+    max_allowed = np.empty(qty.size, np.float64)
+    for i in prange(qty.size):
+        m = land[i] * limit
+        max_allowed[i] = m
+        mask[i] = qty[i] > m
+    return mask, max_allowed
+
 def detect_land_mismatch_with_mapping(df_farmers, df_trans, mapping, limit_per_acre=100):
-    # Copy to avoid side effects
-    farmers = df_farmers.copy()
-    trans = df_trans.copy()
-
-    # Rename the selected columns to canonical names for easier code
-    farmers = farmers.rename(columns={
-        mapping["farmers"]["farmer_id"]: "FarmerID",
-        mapping["farmers"]["land"]: "LandSize_Acres"
-    })
-    if mapping["farmers"]["name"]:
-        farmers = farmers.rename(columns={mapping["farmers"]["name"]: "Name"})
-
-    trans = trans.rename(columns={
-        mapping["transactions"]["farmer_id"]: "FarmerID",
-        mapping["transactions"]["transaction_id"]: "TransactionID",
-        mapping["transactions"]["dealer_id"]: "DealerID",
-        mapping["transactions"]["quantity"]: "Quantity_KG"
-    })
-    if mapping["transactions"]["village"]:
-        trans = trans.rename(columns={mapping["transactions"]["village"]: "VillageID"})
-
-    # Make types compatible for merge
-    farmers["FarmerID"] = farmers["FarmerID"].astype(str)
-    trans["FarmerID"] = trans["FarmerID"].astype(str)
-
-    # Merge left so we keep all transactions
-    merged = pd.merge(trans, farmers, on="FarmerID", how="left", suffixes=("_trans", "_farm"))
-
-    # Coerce LandSize and Quantity to numeric
-    merged["LandSize_Acres"] = pd.to_numeric(merged.get("LandSize_Acres"), errors="coerce")
-    merged["Quantity_KG"] = pd.to_numeric(merged.get("Quantity_KG"), errors="coerce")
-
-    # Warnings for missing data
-    if merged["LandSize_Acres"].isna().any():
-        print(f"Warning: {merged['LandSize_Acres'].isna().sum()} transactions have missing/invalid land size.")
-    if merged["Quantity_KG"].isna().any():
-        print(f"Warning: {merged['Quantity_KG'].isna().sum()} transactions have missing/invalid quantity.")
-    if "Name" not in merged.columns:
+    # Work on the mapped columns directly (no rename, no merge): output uses canonical names
+    fm = mapping["farmers"]
+    tm = mapping["transactions"]
+
+    # Make types compatible for lookup: int64 (or str) categories shared by both frames
+    farmer_ids, trans_ids = align_id_categories(df_farmers[fm["farmer_id"]], df_trans[tm["farmer_id"]])
+    f_codes = farmer_ids.cat.codes.to_numpy()
+    t_codes = trans_ids.cat.codes.to_numpy()
+    known = f_codes >= 0
+
+    # Per-category lookup tables; the extra last slot is read by code -1 (unknown FarmerID).
+    # A FarmerID listed more than once in the farmers file resolves to its last row.
+    n_cats = len(farmer_ids.cat.categories)
+    land_by_code = np.full(n_cats + 1, np.nan)
+    land_by_code[f_codes[known]] = df_farmers[fm["land"]].to_numpy(dtype="float64")[known]
+
+    # LandSize and Quantity were coerced to float64 in main
+    land = land_by_code[t_codes]
+    qty = df_trans[tm["quantity"]].to_numpy(dtype="float64")
+
+    # Warnings for duplicate / missing data
+    farmer_dups = int(known.sum()) - np.unique(f_codes[known]).size
+    if farmer_dups:
+        print(f"Warning: {farmer_dups} duplicate FarmerID row(s) in farmers file; using the last row for each.")
+    land_missing = int(np.isnan(land).sum())
+    qty_missing = int(np.isnan(qty).sum())
+    if land_missing:
+        print(f"Warning: {land_missing} transactions have missing/invalid land size.")
+    if qty_missing:
+        print(f"Warning: {qty_missing} transactions have missing/invalid quantity.")
+    if not fm["name"]:
         print("Note: Farmer 'Name' column not provided or not detected; results will show FarmerID instead.")
 
-    merged["Max_Allowed_KG"] = merged["LandSize_Acres"] * float(limit_per_acre)
+    mask, max_allowed = _flag(qty, land, float(limit_per_acre))
+    idx = mask.nonzero()[0]
 
-    suspicious = merged[merged["Quantity_KG"] > merged["Max_Allowed_KG"]].copy()
-    # select nice output columns
-    out_cols = ["TransactionID", "FarmerID"]
-    if "Name" in suspicious.columns:
-        out_cols.append("Name")
-    out_cols += ["LandSize_Acres", "Quantity_KG", "Max_Allowed_KG", "DealerID"]
-    if "VillageID" in suspicious.columns:
-        out_cols.append("VillageID")
-
-    # ensure columns exist
-    out_cols = [c for c in out_cols if c in suspicious.columns]
-    return suspicious[out_cols].reset_index(drop=True)
+    # build the output columns in display order
+    suspicious = {
+        "TransactionID": df_trans[tm["transaction_id"]].array[idx],
+        "FarmerID": trans_ids.array[idx],
+    }
+    if fm["name"]:
+        name_by_code = np.full(n_cats + 1, np.nan, dtype=object)
+        name_by_code[f_codes[known]] = df_farmers[fm["name"]].to_numpy(dtype=object)[known]
+        suspicious["Name"] = name_by_code[t_codes[idx]]
+    suspicious["LandSize_Acres"] = land[idx]
+    suspicious["Quantity_KG"] = qty[idx]
+    suspicious["Max_Allowed_KG"] = max_allowed[idx]
+    suspicious["DealerID"] = df_trans[tm["dealer_id"]].array[idx]
+    if tm["village"]:
+        suspicious["VillageID"] = df_trans[tm["village"]].array[idx]
+    return pd.DataFrame(suspicious)
 
 # ---------------------------
 # Main interactive runner
@@ -267,12 +406,29 @@ def main():
     print("🔍 FERTILIZER FRAUD DETECTION - INTERACTIVE COLUMN MAPPING")
     print("=" * 70)
 
-    # Load CSVs
-    df_farmers, df_trans = load_csv_interactive()
-    print(f"\n✅ Loaded {len(df_farmers)} farmers and {len(df_trans)} transactions")
+    # Locate CSVs (headers only)
+    pf, pt, fam_header, trans_header = load_csv_interactive()
 
     # Ask user to map columns (interactive)
-    mapping = get_column_mapping(df_farmers, df_trans)
+    mapping = get_column_mapping(fam_header, trans_header)
+
+    # Load only the mapped columns
+    df_farmers = read_csv_cached(pf, usecols=mapped_columns(mapping["farmers"]))
+    df_trans = read_csv_cached(pt, usecols=mapped_columns(mapping["transactions"]))
+    print(f"\n✅ Loaded {len(df_farmers)} farmers and {len(df_trans)} transactions")
+
+    # Coerce numeric columns once; invalid values become NaN (reported by CHECK 1,
+    # skipped by the dealer sums)
+    land_col = mapping["farmers"]["land"]
+    qty_col = mapping["transactions"]["quantity"]
+    df_farmers[land_col] = pd.to_numeric(df_farmers[land_col], errors="coerce").astype("float64")
+    df_trans[qty_col] = pd.to_numeric(df_trans[qty_col], errors="coerce").astype("float64")
+
+    # Encode ID columns once so every later groupby/lookup hashes small integer codes
+    fam_id_col = mapping["farmers"]["farmer_id"]
+    df_farmers[fam_id_col] = df_farmers[fam_id_col].astype("category")
+    for col in (mapping["transactions"]["farmer_id"], mapping["transactions"]["dealer_id"]):
+        df_trans[col] = df_trans[col].astype("category")
 
     # Run checks
     print("\n" + "=" * 70)
@@ -300,14 +456,16 @@ def main():
         print("\n✅ No suspicious dealers found by average-kg-per-transaction threshold!")
 
     # Summary
-    print("\n" + "=" * 70)
-    print("📊 SUMMARY")
-    print("=" * 70)
-    print(f"Total Farmers: {len(df_farmers)}")
-    print(f"Total Transactions: {len(df_trans)}")
-    print(f"Suspicious Transactions: {len(suspicious_farmers)}")
-    print(f"Suspicious Dealers: {len(suspicious_dealers)}")
-    print("=" * 70)
+    buf = io.StringIO()
+    print("\n" + "=" * 70, file=buf)
+    print("📊 SUMMARY", file=buf)
+    print("=" * 70, file=buf)
+    print(f"Total Farmers: {len(df_farmers)}", file=buf)
+    print(f"Total Transactions: {len(df_trans)}", file=buf)
+    print(f"Suspicious Transactions: {len(suspicious_farmers)}", file=buf)
+    print(f"Suspicious Dealers: {len(suspicious_dealers)}", file=buf)
+    print("=" * 70, file=buf)
+    sys.stdout.write(buf.getvalue())
 
 if __name__ == "__main__":
     main()